@@ -5,42 +5,691 @@ Uses PDFtoPrinter.exe for reliable Windows printing.
 """
 
 import asyncio
+import functools
+import html
+import io
 import json
+import locale
+import math
 import sys
 import subprocess
 import tempfile
+import time
 import os
 import traceback
 import re
+import importlib.util
+from html.parser import HTMLParser
 from pathlib import Path
 from typing import Dict, Any, Optional
 
-# ReportLab for PDF generation
+# ReportLab for PDF generation (imported on first use, see _load_reportlab)
+REPORTLAB_AVAILABLE = importlib.util.find_spec("reportlab") is not None
+_reportlab_loaded = False
+
+# Markdown processing (imported on first use, see _load_markdown)
+MARKDOWN_AVAILABLE = importlib.util.find_spec("mistune") is not None
+mistune = None
+_markdown = None  # Shared markdown-to-HTML parser, built alongside the import
+
+def _load_reportlab() -> bool:
+    """Import ReportLab on first use so startup doesn't pay for it."""
+    global REPORTLAB_AVAILABLE, _reportlab_loaded
+    global canvas, letter, A4, getSampleStyleSheet, ParagraphStyle
+    global SimpleDocTemplate, Paragraph, Spacer, KeepTogether, ParaParser
+    global inch, black, TA_CENTER, TA_LEFT, TA_RIGHT
+
+    if _reportlab_loaded or not REPORTLAB_AVAILABLE:
+        return REPORTLAB_AVAILABLE
+
+    try:
+        from reportlab.pdfgen import canvas
+        from reportlab.lib.pagesizes import letter, A4
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, KeepTogether
+        from reportlab.platypus.paraparser import ParaParser
+        from reportlab.lib.units import inch
+        from reportlab.lib.colors import black
+        from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+        _reportlab_loaded = True
+    except ImportError:
+        REPORTLAB_AVAILABLE = False
+    return REPORTLAB_AVAILABLE
+
+@functools.lru_cache(maxsize=None)
+def _sample_styles():
+    """ReportLab's sample stylesheet, built once and shared as the parent of derived styles.
+
+    Callers must derive new ParagraphStyles from it rather than modify its entries.
+    """
+    _load_reportlab()
+    return getSampleStyleSheet()
+
+@functools.lru_cache(maxsize=64)
+def _plain_frag(style):
+    """The fragment ReportLab's markup parser produces for plain text in style.
+
+    Returns None for styles with a textTransform, which the template can't reproduce.
+    """
+    if getattr(style, 'textTransform', None):
+        return None
+    style, frags, _ = ParaParser().parse('x', style)
+    return frags[0] if frags and len(frags) == 1 else None
+
+def _make_paragraph(text: str, style):
+    """Build a Paragraph, skipping ReportLab's markup parser for plain text.
+
+    Text with no tags or entities parses to a single fragment carrying the
+    style's font settings, so that fragment is cloned from a per-style
+    template. Everything else takes the normal Paragraph path.
+    """
+    if '<' in text or '&' in text or '\n' in text:
+        return Paragraph(text, style)
+    template = _plain_frag(style)
+    # Same whitespace cleanup Paragraph applies (cleanBlockQuotedText)
+    text = ' '.join(filter(None, text.strip().split(' ')))
+    if template is None or not text:
+        return Paragraph(text, style)
+    return Paragraph(text, style, frags=[template.clone(text=text, link=[], us_lines=[])])
+
+@functools.lru_cache(maxsize=None)
+def _deferred_canvas():
+    """Canvas class whose save() finishes the last page but defers writing the PDF.
+
+    Used during 4x6 fitting: every candidate layout is drawn as usual, but
+    only the one that is picked gets serialized, by calling write_pdf().
+    """
+    _load_reportlab()
+
+    class DeferredCanvas(canvas.Canvas):
+        def save(self):
+            if len(self._code):
+                self.showPage()
+
+        def write_pdf(self):
+            self._doc.SaveToFile(self._filename, self)
+
+    return DeferredCanvas
+
+def _load_markdown() -> bool:
+    """Import mistune and build the shared parser on first use so startup doesn't pay for it."""
+    global MARKDOWN_AVAILABLE, mistune, _markdown
+
+    if _markdown is not None or not MARKDOWN_AVAILABLE:
+        return MARKDOWN_AVAILABLE
+
+    try:
+        import mistune
+        # The parser holds no per-document state, so one instance serves every
+        # render in the process. escape=True keeps raw HTML in the content from
+        # reaching ReportLab's markup parser.
+        _markdown = mistune.create_markdown(renderer='html', escape=True)
+    except ImportError:
+        MARKDOWN_AVAILABLE = False
+    return MARKDOWN_AVAILABLE
+
+# Fast JSON serialization for responses (falls back to the json module)
 try:
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.pagesizes import letter, A4
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, KeepTogether
-    from reportlab.lib.units import inch
-    from reportlab.lib.colors import black
-    from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-    REPORTLAB_AVAILABLE = True
+    import orjson
+    ORJSON_AVAILABLE = True
 except ImportError:
-    REPORTLAB_AVAILABLE = False
+    ORJSON_AVAILABLE = False
 
-# Page counting for PDF verification
+# Compiled JSON Schema validation for tool arguments (optional, see _compile_validator)
 try:
-    from PyPDF2 import PdfReader
-    PYPDF2_AVAILABLE = True
+    import fastjsonschema
+    FASTJSONSCHEMA_AVAILABLE = True
 except ImportError:
-    PYPDF2_AVAILABLE = False
+    FASTJSONSCHEMA_AVAILABLE = False
 
-# Markdown processing
+# Native printer enumeration on Windows (optional, falls back to PowerShell)
 try:
-    import mistune
-    MARKDOWN_AVAILABLE = True
+    import win32print
+    WIN32PRINT_AVAILABLE = True
 except ImportError:
-    MARKDOWN_AVAILABLE = False
+    WIN32PRINT_AVAILABLE = False
+
+def _enum_printers() -> list:
+    """List local and connected printers through the Windows spooler API.
+
+    Returns dicts shaped like PowerShell's Get-Printer output (Name,
+    DriverName, Status) so both sources format the same way.
+    """
+    flags = win32print.PRINTER_ENUM_LOCAL | win32print.PRINTER_ENUM_CONNECTIONS
+    return [
+        {'Name': p.get('pPrinterName'), 'DriverName': p.get('pDriverName'), 'Status': p.get('Status')}
+        for p in win32print.EnumPrinters(flags, None, 2)
+    ]
+
+def _emit(message: Dict[str, Any]):
+    """Write a JSON-RPC message to stdout as a single newline-terminated line."""
+    data = None
+    if ORJSON_AVAILABLE:
+        try:
+            data = orjson.dumps(message)
+        except TypeError:
+            pass  # e.g. integers wider than 64 bits; let the json module handle it
+    if data is None:
+        data = json.dumps(message).encode('utf-8')
+    sys.stdout.buffer.write(data + b'\n')
+    sys.stdout.buffer.flush()
+
+def _parse_message(line: bytes):
+    """Decode one JSON-RPC line read from stdin."""
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            pass  # invalid JSON or e.g. integers wider than 64 bits; let the json module decide
+    return json.loads(line.strip())
+
+# Largest JSON-RPC message accepted on stdin (print_file content can be large)
+STDIN_LINE_LIMIT = 16 * 1024 * 1024
+
+def _read_stdin_line():
+    """Read one line from stdin (blocking); None if it is longer than STDIN_LINE_LIMIT."""
+    line = sys.stdin.buffer.readline(STDIN_LINE_LIMIT + 1)
+    if len(line) <= STDIN_LINE_LIMIT or line.endswith(b'\n'):
+        return line
+    # Drop the rest of the over-long line
+    while True:
+        rest = sys.stdin.buffer.readline(STDIN_LINE_LIMIT)
+        if not rest or rest.endswith(b'\n'):
+            return None
+
+# Roughly the most characters of running text that fit on two 4x6 pages at the
+# 6pt/0.6 spacing minimums (measured with plain paragraphs, ~11.8k). Content
+# well beyond this is checked at the minimums first, see
+# find_optimal_scaling_with_verification.
+MIN_SETTINGS_CHAR_CAPACITY = 12000
+
+# Number of recently rendered print jobs kept for reprinting identical content
+PDF_CACHE_SIZE = 8
+
+# Keeps console helpers (PowerShell) from allocating a console window on Windows
+SUBPROCESS_CREATIONFLAGS = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+
+# Seconds a list_printers result is reused before asking Windows again
+PRINTER_LIST_TTL = 5.0
+
+# Precompiled patterns for the fallback markdown processor
+_ORDERED_RE = re.compile(r'^(\d+)\.\s+(.*)')
+_UNORDERED_RE = re.compile(r'^[-\*+]\s+(.*)')
+
+# Line classes used by the 4x6 height estimate
+_LINE_BLANK, _LINE_H1, _LINE_H2, _LINE_H3, _LINE_BODY = range(5)
+_HEADING_CLASSES = {'# ': _LINE_H1, '## ': _LINE_H2, '### ': _LINE_H3}
+
+def _classify_line(line: str) -> int:
+    """Classify a stripped line for the 4x6 height estimate."""
+    if not line:
+        return _LINE_BLANK
+    if line[0] != '#':
+        return _LINE_BODY
+    # At most one of the 2-, 3- and 4-character prefixes can be a heading marker
+    return (_HEADING_CLASSES.get(line[:2]) or _HEADING_CLASSES.get(line[:3])
+            or _HEADING_CLASSES.get(line[:4]) or _LINE_BODY)
+
+@functools.lru_cache(maxsize=32)
+def _count_line_classes(content: str) -> tuple:
+    """Count the lines of content in each class, as (blank, h1, h2, h3, body).
+
+    Cached because a single print estimates the same content several times.
+    """
+    counts = [0] * 5
+    for line in content.split('\n'):
+        counts[_classify_line(line.strip())] += 1
+    return tuple(counts)
+
+def _calc_font_sizes(font_size: float, spacing_scale: float) -> Dict[str, float]:
+    """Font sizes and body leading for a 4x6 layout at the given base font size."""
+    return {
+        'title': font_size + 4.0,
+        'h1': font_size + 4.0,
+        'h2': font_size + 2.0,
+        'h3': font_size + 1.0,
+        'body': font_size,
+        'leading_body': font_size * max(1.1, 1.3 * spacing_scale)
+    }
+
+def _calc_spacing(font_size: float, spacing_scale: float) -> Dict[str, float]:
+    """Space before/after each element for a 4x6 layout."""
+    base_spacing = font_size * 0.6
+    return {
+        'space_after_body': max(2, base_spacing * spacing_scale),
+        'space_after_h1': max(8, (font_size + 4.0) * 0.8 * spacing_scale),
+        'space_after_h2': max(6, (font_size + 2.0) * 0.8 * spacing_scale),
+        'space_after_h3': max(4, (font_size + 1.0) * 0.7 * spacing_scale),
+        'space_before_h1': max(10, (font_size + 4.0) * 1.0 * spacing_scale),
+        'space_before_h2': max(8, (font_size + 2.0) * 0.9 * spacing_scale),
+        'space_before_h3': max(6, (font_size + 1.0) * 0.8 * spacing_scale),
+        'space_after_title': max(8, (font_size + 4.0) * 0.8 * spacing_scale)
+    }
+
+def _shrink_schedule(font_size: float, spacing_scale: float, limit: int) -> tuple:
+    """Font size/spacing steps tried when 4x6 content doesn't fit, from the estimate down.
+
+    Each step lowers spacing by 0.1 (to 0.6) and font size by 0.5pt (to 6pt).
+    Returns (steps, settings after the last step, whether the schedule ended
+    at the minimums rather than at the limit).
+    """
+    steps = []
+    while True:
+        steps.append((font_size, spacing_scale))
+        if spacing_scale > 0.6:
+            spacing_scale = max(0.6, spacing_scale - 0.1)
+        if font_size > 6.0:
+            font_size = max(6.0, font_size - 0.5)
+        elif spacing_scale <= 0.6:
+            return steps, (font_size, spacing_scale), True
+        if len(steps) == limit:
+            return steps, (font_size, spacing_scale), False
+
+# Escapes plain text for ReportLab's Paragraph markup in a single pass
+_ESCAPE_TABLE = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;'})
+
+@functools.lru_cache(maxsize=4096)
+def _escape_markdown_text(text: str) -> str:
+    """Decode HTML entities in raw markdown text, then escape it for ReportLab.
+
+    Cached because the 4x6 verification loop re-renders the same content, and
+    documents repeat short strings such as bullets and headings.
+    """
+    # Most lines carry no entities; skip html.unescape's call and regex setup for them
+    if '&' in text:
+        text = html.unescape(text)
+    return text.translate(_ESCAPE_TABLE)
+
+def _inline_emphasis(text: str) -> str:
+    """Convert **bold** and then *italic* markers into <b>/<i> tags.
+
+    Scans with str.find instead of regular expressions. Bold pairs are
+    matched first (shortest match wins). An italic marker cannot directly
+    follow another '*' and must enclose at least one non-'*' character.
+    """
+    if '*' not in text:
+        return text
+
+    # Bold: pair up '**' markers left to right
+    parts = []
+    pos = 0
+    while True:
+        start = text.find('**', pos)
+        if start < 0:
+            break
+        end = text.find('**', start + 2)
+        if end < 0:
+            break
+        parts.append(text[pos:start])
+        parts.append('<b>')
+        parts.append(text[start + 2:end])
+        parts.append('</b>')
+        pos = end + 2
+    if parts:
+        parts.append(text[pos:])
+        text = ''.join(parts)
+
+    # Italic: a lone '*' closed by the next '*' with text in between
+    parts = []
+    pos = 0
+    search = 0
+    while True:
+        start = text.find('*', search)
+        if start < 0:
+            break
+        end = text.find('*', start + 1)
+        if end < 0:
+            break
+        if end == start + 1 or (start > 0 and text[start - 1] == '*'):
+            search = start + 1
+            continue
+        parts.append(text[pos:start])
+        parts.append('<i>')
+        parts.append(text[start + 1:end])
+        parts.append('</i>')
+        pos = search = end + 1
+    if parts:
+        parts.append(text[pos:])
+        text = ''.join(parts)
+    return text
+
+# Heading markers for the fallback tokenizer, probed by prefix length
+_MD_HEADING_KINDS = {'# ': 'h1', '## ': 'h2', '### ': 'h3'}
+
+def _md_heading(line: str):
+    """Tokenize a line starting with '#' as an H1-H3 heading."""
+    for width in (2, 3, 4):
+        kind = _MD_HEADING_KINDS.get(line[:width])
+        if kind:
+            return kind, line[width:].strip(), None
+    return None
+
+def _md_bullet(line: str):
+    """Tokenize a line starting with '-', '*' or '+' as an unordered list item."""
+    match = _UNORDERED_RE.match(line)
+    if match:
+        return 'ul', match.group(1).strip(), None
+    return None
+
+def _md_numbered(line: str):
+    """Tokenize a line starting with a digit as an ordered list item."""
+    match = _ORDERED_RE.match(line)
+    if match:
+        return 'ol', match.group(2).strip(), int(match.group(1))
+    return None
+
+# Fallback tokenizer handlers keyed on the first character of a stripped line
+_MD_LINE_DISPATCH = {'#': _md_heading, '-': _md_bullet, '*': _md_bullet, '+': _md_bullet}
+_MD_LINE_DISPATCH.update(dict.fromkeys('0123456789', _md_numbered))
+
+def _tokenize_markdown_line(line: str):
+    """Classify a stripped, non-empty markdown line as (kind, text, number).
+
+    Kinds are 'h1'-'h3', 'ul', 'ol' (number is the list marker) and 'p'.
+    """
+    handler = _MD_LINE_DISPATCH.get(line[0])
+    token = handler(line) if handler else None
+    return token or ('p', line, None)
+
+def _iter_markdown_paragraphs(content: str, body_style, heading_styles):
+    """Yield flowables for content when mistune is unavailable.
+
+    Handles H1-H3 headings, bullet and numbered lists, and **bold**/*italic*
+    emphasis in plain paragraphs.
+    """
+    in_list = False
+    list_counter = 0
+    ordered_list = False
+
+    for line in content.split('\n'):
+        line = line.strip()
+
+        if not line:
+            if not in_list:
+                yield Spacer(1, 6)
+            continue
+
+        kind, text, number = _tokenize_markdown_line(line)
+
+        if kind == 'ol':
+            if not in_list:
+                in_list = True
+                ordered_list = True
+                list_counter = number
+            elif not ordered_list:
+                # Starting new ordered list
+                ordered_list = True
+                list_counter = number
+            else:
+                list_counter += 1
+
+            yield _make_paragraph(f"{list_counter}. {_escape_markdown_text(text)}", body_style)
+            continue
+
+        if kind == 'ul':
+            in_list = True
+            ordered_list = False
+            yield _make_paragraph(f"• {_escape_markdown_text(text)}", body_style)
+            continue
+
+        # If we were in a list and this isn't a list item, end the list
+        if in_list:
+            in_list = False
+            ordered_list = False
+            yield Spacer(1, 6)
+
+        if kind == 'p':
+            # Simple formatting for bold and italic
+            yield _make_paragraph(_inline_emphasis(_escape_markdown_text(text)), body_style)
+        else:
+            yield _make_paragraph(_escape_markdown_text(text), heading_styles[kind])
+
+# Inline tags passed through to ReportLab's Paragraph markup
+_INLINE_TAGS = {'b', 'i', 'u', 'strong', 'em', 'strike', 'sup', 'sub'}
+
+# Tags in the markup _ParagraphHTMLParser emits (text is escaped, so every '<' starts one)
+_MARKUP_TAG_RE = re.compile(r'<(/?)([a-z]+)[^>]*>')
+
+class _ParagraphHTMLParser(HTMLParser):
+    """Single-pass conversion of mistune's HTML output into layout blocks.
+
+    Block elements (headings, paragraphs, list items) become one
+    (style_key, markup) block per source line, inline formatting is passed
+    through, and nested <ul>/<ol> lists are tracked on a stack. A style_key
+    of None marks the gap after a list. Blocks carry no styles, so the same
+    parse serves every font size tried while fitting a 4x6 card.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []
+        self.lists = []  # Open lists as [tag, next_number]
+        self.block = None  # Tag of the block being collected, None between blocks
+        self.style_key = None
+        self.prefix = ''
+        self.parts = []
+
+    def _start_block(self, tag, style_key, prefix=''):
+        if self.block is not None:
+            self._flush()
+        self.block = tag
+        self.style_key = style_key
+        self.prefix = prefix
+
+    def _flush(self):
+        """Emit the collected block as one block per non-empty line.
+
+        Inline tags still open at the end of a line are closed there and
+        reopened on the next line, so every block is balanced markup.
+        """
+        if self.block is None:
+            return
+        prefix = self.prefix
+        open_tags = []  # (name, opening markup) of inline tags spanning the line break
+        for line in ''.join(self.parts).split('\n'):
+            line = line.strip()
+            reopen = ''.join(markup for _, markup in open_tags)
+            for match in _MARKUP_TAG_RE.finditer(line):
+                closing, name = match.groups()
+                if name == 'br':
+                    continue
+                if not closing:
+                    open_tags.append((name, match.group(0)))
+                elif open_tags and open_tags[-1][0] == name:
+                    open_tags.pop()
+            if _MARKUP_TAG_RE.sub('', line).strip():
+                close = ''.join(f'</{name}>' for name, _ in reversed(open_tags))
+                self.blocks.append((self.style_key, prefix + reopen + line + close))
+                prefix = ''
+        self.block = None
+        self.parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _INLINE_TAGS:
+            self.parts.append(f'<{tag}>')
+        elif tag == 'br':
+            self.parts.append('<br/>')
+        elif tag == 'a':
+            href = dict(attrs).get('href')
+            self.parts.append(f'<a href="{html.escape(href)}">' if href else '<a>')
+        elif tag in ('ul', 'ol'):
+            self._flush()
+            start = dict(attrs).get('start')
+            self.lists.append([tag, int(start) if start and start.isdigit() else 1])
+        elif tag == 'li':
+            if not self.lists:
+                prefix = '• '  # Standalone list item
+            elif self.lists[-1][0] == 'ol':
+                prefix = f"{self.lists[-1][1]}. "
+                self.lists[-1][1] += 1
+            else:
+                prefix = '• '
+            self._start_block('li', 'body', prefix)
+        elif tag in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'pre'):
+            # Paragraphs inside a list item stay part of the item
+            if self.block != 'li':
+                self._start_block(tag, tag if tag in ('h1', 'h2', 'h3') else 'body')
+        elif tag == 'hr':
+            self._flush()
+
+    def handle_startendtag(self, tag, attrs):
+        if tag == 'br':
+            self.parts.append('<br/>')
+        elif tag == 'hr':
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in _INLINE_TAGS or tag == 'a':
+            self.parts.append(f'</{tag}>')
+        elif tag in ('ul', 'ol'):
+            self._flush()
+            if self.lists:
+                self.lists.pop()
+            self.blocks.append((None, ''))
+        elif tag == 'li' or tag == self.block:
+            self._flush()
+
+    def handle_data(self, data):
+        if self.block is None:
+            if not data.strip():
+                return
+            self._start_block('text', 'body')
+        self.parts.append(_escape_markdown_text(data))
+
+    def close(self):
+        super().close()
+        self._flush()
+
+@functools.lru_cache(maxsize=32)
+def _markdown_blocks(content: str) -> tuple:
+    """Convert markdown to a tuple of (style_key, markup) layout blocks.
+
+    Cached because the 4x6 verification loop renders the same content at
+    several font sizes; only the Paragraph objects depend on the styles.
+    """
+    parser = _ParagraphHTMLParser()
+    parser.feed(_markdown(content))
+    parser.close()
+    return tuple(parser.blocks)
+
+def _env_debug() -> bool:
+    """Whether debug output was requested through the MCP_DEBUG environment variable."""
+    return os.environ.get('MCP_DEBUG', '').lower() in ['true', '1', 'yes']
+
+# Tool definitions returned by tools/list; built once since they never change
+_TOOL_DEFINITIONS = [
+    {
+        "name": "print_file",
+        "description": "Print content with proper formatting using PDFtoPrinter",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "content": {
+                    "type": "string",
+                    "description": "Content to print (supports Markdown formatting)"
+                },
+                "filename": {
+                    "type": "string",
+                    "description": "Optional filename for the document"
+                },
+                "format4x6": {
+                    "type": "boolean",
+                    "description": "Format for 4x6 index card printing (sets custom paper size)",
+                    "default": False
+                },
+                "printer_name": {
+                    "type": "string",
+                    "description": "Specific printer to use (uses default if not specified)"
+                },
+                "paper_size": {
+                    "type": "string",
+                    "enum": ["letter", "a4", "legal", "4x6"],
+                    "description": "Paper size to use (letter, a4, legal, or 4x6)"
+                },
+                "orientation": {
+                    "type": "string",
+                    "enum": ["portrait", "landscape"],
+                    "description": "Page orientation (portrait or landscape)"
+                },
+                "debug": {
+                    "type": "boolean",
+                    "description": "Enable debug mode for troubleshooting",
+                    "default": False
+                }
+            },
+            "required": ["content"]
+        }
+    },
+    {
+        "name": "list_printers",
+        "description": "List available printers on this system",
+        "inputSchema": {
+            "type": "object",
+            "properties": {}
+        }
+    },
+    {
+        "name": "test_print",
+        "description": "Print a test page to verify printer setup",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "format4x6": {
+                    "type": "boolean",
+                    "description": "Format test page for 4x6 index card",
+                    "default": False
+                },
+                "printer_name": {
+                    "type": "string",
+                    "description": "Specific printer to use for test (uses default if not specified)"
+                }
+            }
+        }
+    }
+]
+
+_TOOLS_LIST_RESULT = {"tools": _TOOL_DEFINITIONS}
+
+# Python types for the JSON Schema types used in the tool definitions
+_JSON_SCHEMA_TYPES = {"string": str, "boolean": bool, "object": dict}
+
+def _compile_validator(schema: Dict[str, Any]):
+    """Build a callable that raises ValueError when arguments don't match schema.
+
+    Uses fastjsonschema when installed. Otherwise falls back to checking the
+    subset of JSON Schema the tool definitions use: an object with required
+    keys and typed, optionally enumerated, properties.
+    """
+    if FASTJSONSCHEMA_AVAILABLE:
+        return fastjsonschema.compile(schema)
+
+    required = schema.get("required", [])
+    checks = {
+        name: (spec["type"], _JSON_SCHEMA_TYPES[spec["type"]], spec.get("enum"))
+        for name, spec in schema.get("properties", {}).items()
+    }
+
+    def validate(arguments):
+        if not isinstance(arguments, dict):
+            raise ValueError("data must be object")
+        for name in required:
+            if name not in arguments:
+                raise ValueError(f"data must contain ['{name}'] properties")
+        for name, value in arguments.items():
+            check = checks.get(name)
+            if check is None:
+                continue
+            type_name, expected, enum = check
+            if not isinstance(value, expected):
+                raise ValueError(f"data.{name} must be {type_name}")
+            if enum is not None and value not in enum:
+                raise ValueError(f"data.{name} must be one of {enum}")
+        return arguments
+
+    return validate
+
+# Argument validators keyed by tool name, compiled once from the definitions above
+_TOOL_VALIDATORS = {tool["name"]: _compile_validator(tool["inputSchema"]) for tool in _TOOL_DEFINITIONS}
 
 class PrinterMCPServer:
     """Simplified MCP Server for Windows printing using PDFtoPrinter."""
@@ -50,23 +699,40 @@ class PrinterMCPServer:
         self.version = "2.0.0"  # Simplified version
         self.temp_files = []  # Track temporary files for cleanup
         self.pdf_printer_path = self._get_pdf_printer_path()
-        self.verified_pdf = None  # Store verified PDF for printing
         self.final_font_size = None  # Store final font size used
         self.final_spacing = None  # Store final spacing used
+        self._style_cache = {}  # Paragraph styles keyed by layout parameters
+        self._pdf_cache = {}  # (pdf bytes, font, spacing) keyed by (content, filename, format4x6), oldest first
+        self._fitted_pdf = None  # ((content, filename, font, spacing), finish) for the layout a 4x6 fit picked
+        self._pdf_slot = None  # Temp file reused for every print job's PDF
+        self._print_lock = asyncio.Lock()  # Serializes rendering and printing between concurrent calls
+        self._pending = set()  # In-flight message handler tasks
+        self._printers_cache = (0.0, None)  # (monotonic timestamp, list_printers result)
+        self._printers_lock = asyncio.Lock()  # Lets concurrent list_printers calls share one lookup
+
+        # The initialize result only depends on the server identity, so build it once
+        self._initialize_result = {
+            "protocolVersion": "2024-11-05",
+            "capabilities": {
+                "tools": {}
+            },
+            "serverInfo": {
+                "name": self.name,
+                "version": self.version
+            }
+        }
 
-    def count_pdf_pages(self, pdf_file_path: str) -> int:
-        """Count actual pages in generated PDF."""
-        if not PYPDF2_AVAILABLE:
-            print("Warning: PyPDF2 not available for page counting", file=sys.stderr)
-            return 3  # Conservative fallback
-
-        try:
-            with open(pdf_file_path, 'rb') as file:
-                reader = PdfReader(file)
-                return len(reader.pages)
-        except Exception as e:
-            print(f"Error counting PDF pages: {e}", file=sys.stderr)
-            return 3  # Conservative fallback
+        # JSON-RPC method and tool dispatch tables
+        self._methods = {
+            "initialize": self.handle_initialize,
+            "tools/list": self.handle_list_tools,
+            "tools/call": self.handle_call_tool
+        }
+        self._tools = {
+            "print_file": self.print_file,
+            "list_printers": self.list_printers,
+            "test_print": self.test_print
+        }
 
     def _get_pdf_printer_path(self) -> str:
         """Get the path to PDFtoPrinter.exe."""
@@ -81,21 +747,23 @@ class PrinterMCPServer:
 
     async def run(self):
         """Main server loop handling stdio communication."""
-        debug = os.environ.get('MCP_DEBUG', '').lower() in ['true', '1', 'yes']
+        debug = _env_debug()
 
         if debug:
             print("Starting Simplified Printer MCP Server v2.0...", file=sys.stderr)
 
         try:
-            while True:
-                line = sys.stdin.readline()
-                if not line:
-                    break
-
+            async for line in self._read_stdin_lines():
                 try:
-                    message = json.loads(line.strip())
-                    await self.handle_message(message, debug)
-                except json.JSONDecodeError as e:
+                    if line is None:
+                        raise ValueError(f"Message is longer than {STDIN_LINE_LIMIT} bytes")
+                    message = _parse_message(line)
+                    # Handle each request in its own task so a long print job
+                    # doesn't hold up list_printers or other calls behind it
+                    task = asyncio.create_task(self.handle_message(message, debug))
+                    self._pending.add(task)
+                    task.add_done_callback(self._on_message_done)
+                except ValueError as e:  # Includes JSONDecodeError and UnicodeDecodeError
                     error_response = {
                         "jsonrpc": "2.0",
                         "id": None,
@@ -105,8 +773,11 @@ class PrinterMCPServer:
                             "data": str(e)
                         }
                     }
-                    print(json.dumps(error_response))
-                    sys.stdout.flush()
+                    _emit(error_response)
+
+            # stdin closed; let in-flight requests finish and respond
+            if self._pending:
+                await asyncio.gather(*self._pending, return_exceptions=True)
 
         except KeyboardInterrupt:
             if debug:
@@ -114,128 +785,120 @@ class PrinterMCPServer:
         finally:
             self.cleanup_temp_files()
 
+    def _on_message_done(self, task: asyncio.Task):
+        """Forget a finished handler task and report anything it raised."""
+        self._pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Error handling message: {task.exception()!r}", file=sys.stderr)
+
+    async def _read_stdin_lines(self):
+        """Yield raw lines from stdin without blocking the event loop.
+
+        A line longer than STDIN_LINE_LIMIT is skipped and yielded as None.
+        """
+        loop = asyncio.get_running_loop()
+        reader = None
+        # The Proactor event loop on Windows can't reliably read a stdin pipe
+        # that wasn't opened for overlapped I/O, so Windows always reads stdin
+        # in a worker thread
+        if sys.platform != 'win32':
+            reader = asyncio.StreamReader(limit=STDIN_LINE_LIMIT)
+            try:
+                await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+            except (OSError, ValueError, NotImplementedError):
+                reader = None  # stdin is not a pipe (e.g. a console or regular file)
+
+        if reader is None:
+            while True:
+                line = await loop.run_in_executor(None, _read_stdin_line)
+                if line == b'':
+                    return
+                yield line
+
+        while True:
+            try:
+                line = await reader.readuntil(b'\n')
+            except asyncio.IncompleteReadError as e:
+                line = e.partial  # Last line without a newline, or b'' at EOF
+            except asyncio.LimitOverrunError as e:
+                # The line stays buffered; drop it through its newline
+                line, consumed = None, e.consumed
+                while True:
+                    await reader.readexactly(consumed)
+                    try:
+                        await reader.readuntil(b'\n')
+                        break
+                    except asyncio.IncompleteReadError:
+                        break
+                    except asyncio.LimitOverrunError as more:
+                        consumed = more.consumed
+            if line == b'':
+                return
+            yield line
+
     async def handle_message(self, message: Dict[str, Any], debug: bool = False):
         """Handle incoming JSON-RPC messages."""
+        if not isinstance(message, dict):
+            _emit({
+                "jsonrpc": "2.0",
+                "id": None,
+                "error": {
+                    "code": -32600,
+                    "message": "Invalid Request"
+                }
+            })
+            return
+
         method = message.get("method")
         msg_id = message.get("id")
 
         if debug:
             print(f"Received message: {method}", file=sys.stderr)
 
-        if method == "initialize":
-            response = await self.handle_initialize(message.get("params", {}))
-        elif method == "tools/list":
-            response = await self.handle_list_tools()
-        elif method == "tools/call":
-            response = await self.handle_call_tool(message.get("params", {}))
-        else:
+        try:
+            handler = self._methods.get(method)
+            if handler:
+                response = await handler(message.get("params", {}))
+            else:
+                response = {
+                    "jsonrpc": "2.0",
+                    "id": msg_id,
+                    "error": {
+                        "code": -32601,
+                        "message": f"Method not found: {method}"
+                    }
+                }
+        except Exception as e:
+            # Answer the request rather than leave the client waiting on its id
             response = {
                 "jsonrpc": "2.0",
                 "id": msg_id,
                 "error": {
-                    "code": -32601,
-                    "message": f"Method not found: {method}"
+                    "code": -32603,
+                    "message": "Internal error",
+                    "data": str(e)
                 }
             }
+            if debug:
+                response["error"]["data"] += f"\n{traceback.format_exc()}"
 
         if msg_id is not None:
             response["id"] = msg_id
 
-        print(json.dumps(response))
-        sys.stdout.flush()
+        _emit(response)
 
     async def handle_initialize(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """Handle MCP initialization."""
         return {
             "jsonrpc": "2.0",
-            "result": {
-                "protocolVersion": "2024-11-05",
-                "capabilities": {
-                    "tools": {}
-                },
-                "serverInfo": {
-                    "name": self.name,
-                    "version": self.version
-                }
-            }
+            "result": self._initialize_result
         }
 
-    async def handle_list_tools(self) -> Dict[str, Any]:
+    async def handle_list_tools(self, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """List available tools."""
         return {
             "jsonrpc": "2.0",
-            "result": {
-                "tools": [
-                    {
-                        "name": "print_file",
-                        "description": "Print content with proper formatting using PDFtoPrinter",
-                        "inputSchema": {
-                            "type": "object",
-                            "properties": {
-                                "content": {
-                                    "type": "string",
-                                    "description": "Content to print (supports Markdown formatting)"
-                                },
-                                "filename": {
-                                    "type": "string",
-                                    "description": "Optional filename for the document"
-                                },
-                                "format4x6": {
-                                    "type": "boolean",
-                                    "description": "Format for 4x6 index card printing (sets custom paper size)",
-                                    "default": False
-                                },
-                                "printer_name": {
-                                    "type": "string",
-                                    "description": "Specific printer to use (uses default if not specified)"
-                                },
-                                "paper_size": {
-                                    "type": "string",
-                                    "enum": ["letter", "a4", "legal", "4x6"],
-                                    "description": "Paper size to use (letter, a4, legal, or 4x6)"
-                                },
-                                "orientation": {
-                                    "type": "string",
-                                    "enum": ["portrait", "landscape"],
-                                    "description": "Page orientation (portrait or landscape)"
-                                },
-                                "debug": {
-                                    "type": "boolean",
-                                    "description": "Enable debug mode for troubleshooting",
-                                    "default": False
-                                }
-                            },
-                            "required": ["content"]
-                        }
-                    },
-                    {
-                        "name": "list_printers",
-                        "description": "List available printers on this system",
-                        "inputSchema": {
-                            "type": "object",
-                            "properties": {}
-                        }
-                    },
-                    {
-                        "name": "test_print",
-                        "description": "Print a test page to verify printer setup",
-                        "inputSchema": {
-                            "type": "object",
-                            "properties": {
-                                "format4x6": {
-                                    "type": "boolean",
-                                    "description": "Format test page for 4x6 index card",
-                                    "default": False
-                                },
-                                "printer_name": {
-                                    "type": "string",
-                                    "description": "Specific printer to use for test (uses default if not specified)"
-                                }
-                            }
-                        }
-                    }
-                ]
-            }
+            "result": _TOOLS_LIST_RESULT
         }
 
     async def handle_call_tool(self, params: Dict[str, Any]) -> Dict[str, Any]:
@@ -243,15 +906,25 @@ class PrinterMCPServer:
         tool_name = params.get("name")
         arguments = params.get("arguments", {})
 
+        # Reject malformed arguments before doing any PDF or printer work
+        validator = _TOOL_VALIDATORS.get(tool_name)
+        if validator is not None:
+            try:
+                validator(arguments)
+            except ValueError as e:
+                return {
+                    "jsonrpc": "2.0",
+                    "error": {
+                        "code": -32602,
+                        "message": f"Invalid params for {tool_name}: {e}"
+                    }
+                }
+
         try:
-            if tool_name == "print_file":
-                result = await self.print_file(**arguments)
-            elif tool_name == "list_printers":
-                result = await self.list_printers(**arguments)
-            elif tool_name == "test_print":
-                result = await self.test_print(**arguments)
-            else:
+            tool = self._tools.get(tool_name)
+            if tool is None:
                 raise ValueError(f"Unknown tool: {tool_name}")
+            result = await tool(**arguments)
 
             return {
                 "jsonrpc": "2.0",
@@ -266,7 +939,10 @@ class PrinterMCPServer:
             }
 
         except Exception as e:
-            error_msg = f"Error in {tool_name}: {str(e)}\n{traceback.format_exc()}"
+            error_msg = f"Error in {tool_name}: {str(e)}"
+            # Formatting the stack is only worth it when someone is debugging
+            if (isinstance(arguments, dict) and arguments.get("debug")) or _env_debug():
+                error_msg += f"\n{traceback.format_exc()}"
             return {
                 "jsonrpc": "2.0",
                 "error": {
@@ -283,43 +959,73 @@ class PrinterMCPServer:
         if debug:
             print(f"print_file called with PDFtoPrinter: format4x6={format4x6}, printer={printer_name}", file=sys.stderr)
 
+        # Nothing to render, so skip PDF generation and the printer round-trip
+        if not content or not content.strip():
+            return "Error: No content to print"
+
         # Check dependencies
         if not REPORTLAB_AVAILABLE:
             return "Error: ReportLab is required for PDF generation. Install with: pip install reportlab"
 
-        try:
-            # Clear any cached verified PDF from previous jobs to ensure fresh content
-            if self.verified_pdf:
-                if debug:
-                    print(f"Clearing cached verified PDF from previous job: {self.verified_pdf}", file=sys.stderr)
-                self.verified_pdf = None
+        # Print jobs share the PDF slot and verification state, so run them one at a time
+        async with self._print_lock:
+            try:
+                # A failed print leaves the previous job's settings behind
                 self.final_font_size = None
                 self.final_spacing = None
 
-            # For 4x6 format, use the verified PDF from verification if available
-            if format4x6 and self.verified_pdf and os.path.exists(self.verified_pdf):
-                if debug:
-                    print(f"Using verified PDF: {self.verified_pdf}", file=sys.stderr)
-                pdf_file = self.verified_pdf
-                # Clear the stored PDF after use
-                self.verified_pdf = None
-            else:
-                # Create formatted PDF (normal flow or non-4x6 format)
-                pdf_file = self.create_formatted_pdf(content, filename, format4x6, debug)
+                pdf_file = await self._create_pdf_in_thread(content, filename, format4x6, debug,
+                                                            output_path=self._get_pdf_slot())
                 if not pdf_file:
                     return "Error: Failed to create PDF file"
 
-            # Print using PDFtoPrinter
-            result = await self.print_with_pdftoprinter(pdf_file, printer_name, debug)
+                # Print using PDFtoPrinter
+                result = await self.print_with_pdftoprinter(pdf_file, printer_name, debug)
 
-            return result
+                return result
 
-        except Exception as e:
-            # Return the full error with traceback for debugging
-            error_msg = f"Error creating or printing PDF: {str(e)}"
-            if debug:
-                error_msg += f"\n{traceback.format_exc()}"
-            return error_msg
+            except Exception as e:
+                # Return the full error with traceback for debugging
+                error_msg = f"Error creating or printing PDF: {str(e)}"
+                if debug:
+                    error_msg += f"\n{traceback.format_exc()}"
+                return error_msg
+
+    async def _create_pdf_in_thread(self, *args, **kwargs) -> Optional[str]:
+        """Run create_formatted_pdf in a worker thread so layout doesn't block the event loop.
+
+        Callers hold _print_lock, so only one render touches the shared caches at a time.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(self.create_formatted_pdf, *args, **kwargs))
+
+    async def _run_command(self, cmd, timeout: float, cwd=None,
+                           capture_stdout: bool = True) -> subprocess.CompletedProcess:
+        """Run a command without blocking the event loop, capturing decoded output.
+
+        With capture_stdout=False the command's stdout is discarded and the
+        result's stdout is None; stderr is always captured.
+        """
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE if capture_stdout else asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=cwd,
+            creationflags=SUBPROCESS_CREATIONFLAGS
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise subprocess.TimeoutExpired(cmd, timeout)
+
+        encoding = locale.getpreferredencoding(False)
+        return subprocess.CompletedProcess(
+            cmd, proc.returncode,
+            stdout.decode(encoding, errors='replace') if stdout is not None else None,
+            stderr.decode(encoding, errors='replace') if stderr else ''
+        )
 
     async def print_with_pdftoprinter(self, pdf_file: str, printer_name: Optional[str] = None, debug: bool = False) -> str:
         """Print PDF using PDFtoPrinter.exe."""
@@ -338,14 +1044,9 @@ class PrinterMCPServer:
             if debug:
                 print(f"Command: {' '.join(cmd)}", file=sys.stderr)
 
-            # Execute PDFtoPrinter
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=60,
-                cwd=Path(__file__).parent
-            )
+            # Execute PDFtoPrinter; its stdout is only ever shown in debug mode
+            result = await self._run_command(cmd, timeout=60, cwd=Path(__file__).parent,
+                                             capture_stdout=debug)
 
             if debug:
                 print(f"PDFtoPrinter return code: {result.returncode}", file=sys.stderr)
@@ -380,6 +1081,8 @@ class PrinterMCPServer:
         if not format4x6:
             return 10.0, 1.0
 
+        _load_reportlab()
+
         # Available space for two 4x6 pages
         page_height = 4 * inch
         margin = 0.1 * inch
@@ -388,92 +1091,93 @@ class PrinterMCPServer:
         if debug:
             print(f"Target height: {usable_height:.1f} points (two 4x6 pages)", file=sys.stderr)
 
-        # Quick content analysis to catch obviously too-long content
-        lines = [line.strip() for line in content.split('\n') if line.strip()]
-        if len(lines) > 200:  # Rough heuristic: too many lines
-            raise Exception(f"Content appears too long ({len(lines)} lines). Maximum recommended is ~150 lines for 4x6 format.")
+        # Quick content analysis to catch obviously too-long content.
+        # The height estimate only needs the number of lines of each class.
+        blank_count, h1_count, h2_count, h3_count, body_count = _count_line_classes(content)
 
-        def estimate_realistic_height(content, font_size, spacing_scale):
-            """More realistic height estimation using actual line spacing."""
-            total_height = 0
-            lines = content.split('\n')
+        non_empty_count = h1_count + h2_count + h3_count + body_count
+        if non_empty_count > 200:  # Rough heuristic: too many lines
+            raise Exception(f"Content appears too long ({non_empty_count} lines). Maximum recommended is ~150 lines for 4x6 format.")
 
+        def body_line_factor(spacing_scale):
+            """Body text: line height with proper spacing."""
+            return max(1.15, 1.4 * spacing_scale)
+
+        def estimate_realistic_height(font_size, spacing_scale):
+            """More realistic height estimation using actual line spacing."""
             # Font sizes for different elements
             h1_size = font_size + 2.0
             h2_size = font_size + 1.0
             h3_size = font_size + 0.5
 
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    # Empty line = 0.7 * line height
-                    total_height += font_size * 0.7
-                elif line.startswith('# '):
-                    # H1: font height + modest spacing
-                    total_height += h1_size + (h1_size * 0.4)
-                elif line.startswith('## '):
-                    # H2: font height + modest spacing
-                    total_height += h2_size + (h2_size * 0.3)
-                elif line.startswith('### '):
-                    # H3: font height + modest spacing
-                    total_height += h3_size + (h3_size * 0.2)
-                else:
-                    # Body text: line height with proper spacing
-                    total_height += font_size * max(1.15, 1.4 * spacing_scale)
+            return (blank_count * font_size * 0.7               # Empty line = 0.7 * line height
+                    + h1_count * (h1_size + h1_size * 0.4)      # H1: font height + modest spacing
+                    + h2_count * (h2_size + h2_size * 0.3)      # H2: font height + modest spacing
+                    + h3_count * (h3_size + h3_size * 0.2)      # H3: font height + modest spacing
+                    + body_count * font_size * body_line_factor(spacing_scale))
 
-            return total_height
+        def fits(font_size, spacing_scale):
+            return estimate_realistic_height(font_size, spacing_scale) <= usable_height
 
-        # Binary search for optimal font size (prioritizing readability)
         best_font = min_font_size
         best_spacing = 1.0
+        test_spacing = default_spacing_scale
+
+        # The estimate is linear in the font size (height = slope * font + offset),
+        # so solve for the largest font directly instead of stepping down from the top
+        slope = (0.7 * blank_count + 1.4 * h1_count + 1.3 * h2_count + 1.2 * h3_count
+                 + body_line_factor(test_spacing) * body_count)
+        offset = 2.8 * h1_count + 1.3 * h2_count + 0.6 * h3_count
+        if slope:
+            test_font = min(max_font_size, math.floor((usable_height - offset) / slope * 2) / 2)
+        else:
+            test_font = max_font_size
 
-        # Start from largest font and work down
-        test_font = max_font_size
-        while test_font >= min_font_size:
-            # Test with reasonable spacing first
-            test_spacing = default_spacing_scale
-
-            estimated_height = estimate_realistic_height(content, test_font, test_spacing)
-
-            if debug:
-                print(f"Testing: font={test_font:.1f}pt, spacing={test_spacing:.2f}, height={estimated_height:.1f}", file=sys.stderr)
-
-            if estimated_height <= usable_height:
-                # This font size works, try to optimize spacing for better readability
-                best_spacing = test_spacing
-                best_font = test_font
-
-                # Try to reduce spacing slightly for better readability
-                for spacing_test in [test_spacing - 0.1, test_spacing - 0.05]:
-                    if spacing_test >= 0.6:  # Minimum readable spacing
-                        test_height = estimate_realistic_height(content, test_font, spacing_test)
-                        if test_height <= usable_height:
-                            best_spacing = spacing_test
-                            if debug:
-                                print(f"  Improved spacing to {spacing_test:.2f}", file=sys.stderr)
-                        else:
-                            break
-
-                # Found a good font size, no need to try smaller fonts
-                break
-
+        # Snap to the 0.5pt grid against the estimate itself, in case of float rounding at the boundary
+        while test_font + 0.5 <= max_font_size and fits(test_font + 0.5, test_spacing):
+            test_font += 0.5
+        while test_font >= min_font_size and not fits(test_font, test_spacing):
             test_font -= 0.5
 
+        if debug:
+            print(f"Solved: font={test_font:.1f}pt, spacing={test_spacing:.2f}, "
+                  f"height={estimate_realistic_height(test_font, test_spacing):.1f}", file=sys.stderr)
+
+        if test_font >= min_font_size:
+            # This font size works, try to optimize spacing for better readability
+            best_spacing = test_spacing
+            best_font = test_font
+
+            # Try to reduce spacing slightly for better readability
+            for spacing_test in [test_spacing - 0.1, test_spacing - 0.05]:
+                if spacing_test >= 0.6:  # Minimum readable spacing
+                    if fits(test_font, spacing_test):
+                        best_spacing = spacing_test
+                        if debug:
+                            print(f"  Improved spacing to {spacing_test:.2f}", file=sys.stderr)
+                    else:
+                        break
+
         # Check if we found a readable solution
         if best_font < min_font_size:
             raise Exception(f"Content is too long to fit on two 4x6 pages even at minimum readable font size ({min_font_size}pt). "
                            f"Please reduce content length or use regular page format.")
 
         if debug:
-            print(f"OPTIMAL: font={best_font:.1f}pt, spacing={best_spacing:.2f}, height={estimate_realistic_height(content, best_font, best_spacing):.1f}", file=sys.stderr)
+            print(f"OPTIMAL: font={best_font:.1f}pt, spacing={best_spacing:.2f}, height={estimate_realistic_height(best_font, best_spacing):.1f}", file=sys.stderr)
 
         return best_font, best_spacing
 
     def find_optimal_scaling_with_verification(self, content, format4x6, filename=None, debug=False) -> tuple:
-        """True recursive auto-shrinking with actual PDF verification.
+        """True recursive auto-shrinking with actual layout verification.
 
-        Creates real PDFs and counts actual pages until content fits on 2 pages.
-        Uses the exact same PDF creation logic as final output.
+        Lays out the real document and counts actual pages until content fits
+        on 2 pages. Uses the exact same flowables and styles as final output,
+        but skips writing the PDF for each attempt.
+
+        The shrink steps from the initial estimate are fixed (see
+        _shrink_schedule), so the first step that fits is found by galloping
+        forward and then bisecting instead of trying every step in turn.
         """
         if not format4x6:
             return 10.0, 1.0  # Default values for non-4x6 format
@@ -487,630 +1191,458 @@ class PrinterMCPServer:
         if debug:
             print(f"Initial estimate: font={estimated_font:.1f}pt, spacing={estimated_spacing:.2f}", file=sys.stderr)
 
-        # Step 2: Test with ACTUAL final PDF creation
-        current_font = estimated_font
-        current_spacing = estimated_spacing
+        # Step 2: Test steps of the shrink schedule with ACTUAL final layouts
         max_iterations = 20  # Allow more iterations to reach minimum font size
-
-        for iteration in range(max_iterations):
+        steps, (last_font, last_spacing), at_minimum = _shrink_schedule(
+            estimated_font, estimated_spacing, max_iterations)
+        page_counts = {}
+        finishers = {}  # Unwritten layouts of the steps that fit, by index
+
+        def pages_at(index):
+            if index in page_counts:
+                return page_counts[index]
+            current_font, current_spacing = steps[index]
             if debug:
-                print(f"\nIteration {iteration + 1}: font={current_font:.1f}pt, spacing={current_spacing:.2f}", file=sys.stderr)
+                print(f"\nStep {index + 1}: font={current_font:.1f}pt, spacing={current_spacing:.2f}", file=sys.stderr)
 
             try:
-                # Create the ACTUAL final PDF (not a test PDF)
-                actual_pdf = self.create_formatted_pdf(
-                    content=content,
-                    filename=filename,
-                    format4x6=True,
-                    debug=debug,
-                    verification_mode=True,  # Temporary mode for verification
-                    current_font=current_font,
-                    current_spacing=current_spacing
-                )
-
-                if actual_pdf and os.path.exists(actual_pdf):
-                    try:
-                        # Count actual pages using PyPDF2
-                        actual_pages = self.count_pdf_pages(actual_pdf)
-
-                        if debug:
-                            print(f"Actual PDF page count: {actual_pages}", file=sys.stderr)
-
-                        # Success! Content fits on 2 pages or less
-                        if actual_pages <= 2:
-                            if debug:
-                                print(f"SUCCESS: Content fits on {actual_pages} pages with font={current_font:.1f}pt, spacing={current_spacing:.2f}", file=sys.stderr)
-
-                            # Store the successful PDF for printing
-                            successful_pdf = actual_pdf
-                            self.verified_pdf = successful_pdf  # Store for later use
-                            self.final_font_size = current_font  # Store final font size
-                            self.final_spacing = current_spacing  # Store final spacing
-                            return current_font, current_spacing
-
-                        # Too many pages, need to shrink more
-                        if actual_pages > 2:
-                            if debug:
-                                print(f"TOO MANY PAGES ({actual_pages}), shrinking further...", file=sys.stderr)
-
-                            # Remove the failed PDF before retrying
-                            try:
-                                os.remove(actual_pdf)
-                            except:
-                                pass
-
-                            # Prioritize spacing reduction first, then font size
-                            if current_spacing > 0.6:
-                                current_spacing = max(0.6, current_spacing - 0.1)
-                                if debug:
-                                    print(f"Reducing spacing to {current_spacing:.2f}", file=sys.stderr)
-
-                            # Always try font reduction if we're still over 2 pages
-                            if current_font > 6.0:
-                                current_font = max(6.0, current_font - 0.5)
-                                if debug:
-                                    print(f"Reducing font to {current_font:.1f}pt", file=sys.stderr)
-                            elif current_font <= 6.0 and current_spacing <= 0.6:
-                                # We're at minimum readable font size (6pt) and minimum spacing (0.6)
-                                # Content still doesn't fit even at absolute minimums
-                                raise Exception(f"Content is too long to fit on two 4x6 pages even at minimum readable font size (6pt) "
-                                              f"and minimum spacing (0.6). Content required {actual_pages} pages with "
-                                              f"font={current_font:.1f}pt, spacing={current_spacing:.2f}. "
-                                              f"Please reduce content length or use regular page format.")
-
-                    except Exception as e:
-                        if debug:
-                            print(f"Error counting PDF pages: {e}", file=sys.stderr)
-                        # Clean up and fail
-                        try:
-                            os.remove(actual_pdf)
-                        except:
-                            pass
-                        raise Exception(f"PDF page counting failed: {e}")
-                else:
-                    raise Exception("Failed to create actual PDF")
-
+                # Lay out the ACTUAL final document (same flowables and styles)
+                # and count its pages without serializing a PDF yet
+                actual_pages, finish = self._layout_4x6(content, filename, current_font,
+                                                        current_spacing, debug)
+                if actual_pages <= 2:
+                    finishers[index] = finish
+                if not actual_pages:
+                    raise Exception("Failed to lay out actual PDF")
             except Exception as e:
                 if debug:
                     print(f"Error during PDF creation: {e}", file=sys.stderr)
                 # Don't fall back to estimates - fail hard to surface the real issue
                 raise Exception(f"PDF creation failed: {e}")
 
-        # If we get here, all iterations failed
-        raise Exception(f"Unable to fit content on two 4x6 pages after {max_iterations} attempts. "
-                       f"Last attempt: font={current_font:.1f}pt, spacing={current_spacing:.2f}. "
-                       f"Please reduce content length or use regular page format.")
-
-    def test_content_fit(self, content, font_sizes, format4x6, debug=False) -> bool:
-        """Test if content fits on two 4x6 pages with given font sizes."""
-        if not format4x6:
-            return True  # No size constraints for regular pages
-
-        # Create temporary styles with test font sizes
-        styles = getSampleStyleSheet()
-
-        # Calculate available space for two 4x6 pages
-        page_width = 6 * inch
-        page_height = 4 * inch
-        margin = 0.1 * inch
-        usable_height = (page_height - 2 * margin) * 2  # Two pages
-        usable_width = page_width - 2 * margin
-
-        # Create test styles
-        test_body_style = ParagraphStyle(
-            'TestBody',
-            parent=styles['Normal'],
-            fontSize=font_sizes['body'],
-            spaceAfter=6,
-            leading=font_sizes['leading_body']
-        )
-
-        test_h1_style = ParagraphStyle(
-            'TestH1',
-            parent=styles['Heading1'],
-            fontSize=font_sizes['h1'],
-            spaceAfter=12,
-            spaceBefore=15
-        )
-
-        test_h2_style = ParagraphStyle(
-            'TestH2',
-            parent=styles['Heading2'],
-            fontSize=font_sizes['h2'],
-            spaceAfter=10,
-            spaceBefore=12
-        )
-
-        test_h3_style = ParagraphStyle(
-            'TestH3',
-            parent=styles['Heading3'],
-            fontSize=font_sizes['h3'],
-            spaceAfter=8,
-            spaceBefore=10
-        )
-
-        # Process content into story (simplified version)
-        story = []
-        lines = content.split('\n')
+            if debug:
+                print(f"Actual PDF page count: {actual_pages}", file=sys.stderr)
+            page_counts[index] = actual_pages
+            return actual_pages
+
+        # Gallop through steps 0, 1, 3, 7, ... until one fits, then bisect
+        # between the last step that didn't fit and the one that did
+        last = len(steps) - 1
+        failed, probe = -1, 0
+
+        # Content far past what two cards hold even at the minimums would walk
+        # the whole schedule before failing, so try the last step first. This
+        # only reorders the probes: if it fits, the search below runs as usual.
+        if last > 1 and len(content) > MIN_SETTINGS_CHAR_CAPACITY * 1.2:
+            if debug:
+                print(f"Content is {len(content)} characters, checking minimum settings first", file=sys.stderr)
+            if pages_at(last) > 2:
+                probe = last
 
-        for line in lines:
-            line = line.strip()
-            if not line:
-                story.append(Spacer(1, 6))
-            elif line.startswith('# '):
-                story.append(Paragraph(line[2:], test_h1_style))
-            elif line.startswith('## '):
-                story.append(Paragraph(line[3:], test_h2_style))
-            elif line.startswith('### '):
-                story.append(Paragraph(line[4:], test_h3_style))
+        while pages_at(probe) > 2:
+            if debug:
+                print(f"TOO MANY PAGES ({page_counts[probe]}), shrinking further...", file=sys.stderr)
+            if probe == last:
+                if at_minimum:
+                    # We're at minimum readable font size (6pt) and minimum spacing (0.6)
+                    # Content still doesn't fit even at absolute minimums
+                    raise Exception("Content is too long to fit on two 4x6 pages even at minimum readable font size (6pt) "
+                                    f"and minimum spacing (0.6). Content required {page_counts[probe]} pages with "
+                                    f"font={last_font:.1f}pt, spacing={last_spacing:.2f}. "
+                                    f"Please reduce content length or use regular page format.")
+                # If we get here, all iterations failed
+                raise Exception(f"Unable to fit content on two 4x6 pages after {max_iterations} attempts. "
+                               f"Last attempt: font={last_font:.1f}pt, spacing={last_spacing:.2f}. "
+                               f"Please reduce content length or use regular page format.")
+            failed, probe = probe, min(2 * probe + 1, last)
+
+        while probe - failed > 1:
+            middle = (failed + probe) // 2
+            if pages_at(middle) <= 2:
+                probe = middle
             else:
-                # Simple formatting for list items
-                if re.match(r'^[a-z]\.', line) or re.match(r'^\d+\.', line) or line.startswith('- '):
-                    # Convert lettered lists and dashes to bullets, keep numbered lists
-                    if re.match(r'^[a-z]\.', line):
-                        formatted_line = re.sub(r'^[a-z]\.\s*', '• ', line)
-                    elif line.startswith('- '):
-                        formatted_line = re.sub(r'^-\s*', '• ', line)
-                    else:
-                        formatted_line = line  # Keep numbered lists unchanged
-                    story.append(Paragraph(formatted_line, test_body_style))
-                else:
-                    story.append(Paragraph(line, test_body_style))
-
-        # Estimate total height
-        estimated_height = self.estimate_content_height(story, usable_width, usable_height, debug)
+                failed = middle
 
+        # Success! Content fits on 2 pages or less
+        current_font, current_spacing = steps[probe]
         if debug:
-            print(f"Usable height for two 4x6 pages: {usable_height} points", file=sys.stderr)
-            print(f"Estimated content height: {estimated_height} points", file=sys.stderr)
-            print(f"Content fits: {estimated_height <= usable_height}", file=sys.stderr)
+            print(f"SUCCESS: Content fits on {page_counts[probe]} pages with font={current_font:.1f}pt, spacing={current_spacing:.2f}", file=sys.stderr)
 
-        return estimated_height <= usable_height
+        # Hand the chosen layout to _render_pdf so it only has to be written out
+        self._fitted_pdf = ((content, filename, current_font, current_spacing), finishers[probe])
+        self.final_font_size = current_font  # Store final font size
+        self.final_spacing = current_spacing  # Store final spacing
+        return current_font, current_spacing
 
     def create_formatted_pdf(self, content: str, filename: Optional[str] = None,
                             format4x6: bool = False, debug: bool = False, verification_mode: bool = False,
-                            current_font: Optional[float] = None, current_spacing: Optional[float] = None) -> Optional[str]:
-        """Create a formatted PDF from content."""
-        if not REPORTLAB_AVAILABLE:
-            return None
-
-        try:
-            # Create temporary PDF file
-            temp_file = tempfile.NamedTemporaryFile(mode='wb', suffix='.pdf', delete=False)
-            temp_file_path = temp_file.name
-            temp_file.close()
-
-            # Verify the file was created and is writable
-            if not os.path.exists(temp_file_path):
-                raise RuntimeError(f"Failed to create temporary file: {temp_file_path}")
-
-            # Add to temp_files list only if not in verification mode
-            if not verification_mode:
-                self.temp_files.append(temp_file_path)
-
-            # Set up page size
-            if format4x6:
-                # 4x6 index cards are typically used in landscape orientation
-                # So we make it 6" wide x 4" tall for proper use
-                page_size = (6 * inch, 4 * inch)  # 6x4 inches (landscape 4x6)
-                margin = 0.1 * inch
-            else:
-                page_size = letter
-                margin = 0.75 * inch
-
-            # Create PDF document
-            doc = SimpleDocTemplate(
-                temp_file_path,
-                pagesize=page_size,
-                leftMargin=margin,
-                rightMargin=margin,
-                topMargin=margin,
-                bottomMargin=margin
-            )
+                            current_font: Optional[float] = None, current_spacing: Optional[float] = None,
+                            output_path: Optional[str] = None) -> Optional[str]:
+        """Create a formatted PDF from content.
 
-            # Get styles
-            styles = getSampleStyleSheet()
-
-            if format4x6:
-                # Multi-dimensional content fitting for 4x6 format
-                if debug:
-                    print("Starting multi-dimensional font and spacing optimization...", file=sys.stderr)
-
-                # Find optimal font size and spacing scale with verification
-                # Skip verification if we're already in verification mode (to avoid circular dependency)
-                if verification_mode:
-                    # Use the passed current_font and current_spacing values for verification
-                    if current_font is not None and current_spacing is not None:
-                        optimal_font_size = current_font
-                        spacing_scale = current_spacing
-                        if debug:
-                            print(f"VERIFICATION MODE: Using passed values font={optimal_font_size:.1f}pt, spacing={spacing_scale:.2f}", file=sys.stderr)
-                    else:
-                        # Fallback: Use simple estimation if no values provided
-                        optimal_font_size, spacing_scale = self.find_optimal_scaling(content, format4x6, debug)
-                        if debug:
-                            print(f"VERIFICATION MODE: No values provided, using estimation font={optimal_font_size:.1f}pt, spacing={spacing_scale:.2f}", file=sys.stderr)
-                else:
-                    # Use full verification for normal mode
-                    optimal_font_size, spacing_scale = self.find_optimal_scaling_with_verification(content, format4x6, filename, debug)
-
-                if debug:
-                    print(f"Optimal settings: font={optimal_font_size:.1f}pt, spacing_scale={spacing_scale:.2f}", file=sys.stderr)
-
-                # Calculate font sizes and spacing with optimal settings
-                def calculate_font_sizes(font_size, spacing_scale):
-                    return {
-                        'title': font_size + 4.0,
-                        'h1': font_size + 4.0,
-                        'h2': font_size + 2.0,
-                        'h3': font_size + 1.0,
-                        'body': font_size,
-                        'leading_body': font_size * max(1.1, 1.3 * spacing_scale)
-                    }
+        The PDF is written to output_path when given, otherwise to a new temporary file.
+        """
+        if not _load_reportlab():
+            return None
 
-                def calculate_spacing(font_size, spacing_scale):
-                    base_spacing = font_size * 0.6
-                    return {
-                        'space_after_body': max(2, base_spacing * spacing_scale),
-                        'space_after_h1': max(8, (font_size + 4.0) * 0.8 * spacing_scale),
-                        'space_after_h2': max(6, (font_size + 2.0) * 0.8 * spacing_scale),
-                        'space_after_h3': max(4, (font_size + 1.0) * 0.7 * spacing_scale),
-                        'space_before_h1': max(10, (font_size + 4.0) * 1.0 * spacing_scale),
-                        'space_before_h2': max(8, (font_size + 2.0) * 0.9 * spacing_scale),
-                        'space_before_h3': max(6, (font_size + 1.0) * 0.8 * spacing_scale),
-                        'space_after_title': max(8, (font_size + 4.0) * 0.8 * spacing_scale)
-                    }
+        # Reprinting identical content reuses the PDF and the 4x6 settings found for it
+        cache_key = None if verification_mode else (content, filename, format4x6)
+        cached = self._pdf_cache.get(cache_key) if cache_key else None
+        if cached:
+            pdf_data, self.final_font_size, self.final_spacing = cached
+            if debug:
+                print("Reusing PDF rendered for identical content", file=sys.stderr)
+        else:
+            pdf_data = self._render_pdf(content, filename, format4x6, debug, verification_mode,
+                                        current_font, current_spacing)
+            if cache_key:
+                if len(self._pdf_cache) >= PDF_CACHE_SIZE:
+                    del self._pdf_cache[next(iter(self._pdf_cache))]
+                settings = (self.final_font_size, self.final_spacing) if format4x6 else (None, None)
+                self._pdf_cache[cache_key] = (pdf_data,) + settings
+        # Add to temp_files list only if not in verification mode
+        return self._write_pdf(pdf_data, output_path, track=not verification_mode, debug=debug)
+
+    def _write_pdf(self, pdf_data: bytes, path: Optional[str] = None,
+                   track: bool = True, debug: bool = False) -> str:
+        """Write rendered PDF bytes to path (or a new temporary file) and return the path."""
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix='.pdf')
+            with os.fdopen(fd, 'wb') as pdf_file:
+                pdf_file.write(pdf_data)
+            if track:
+                self.temp_files.append(path)
+        else:
+            with open(path, 'wb') as pdf_file:
+                pdf_file.write(pdf_data)
 
-                font_sizes = calculate_font_sizes(optimal_font_size, spacing_scale)
-                spacing = calculate_spacing(optimal_font_size, spacing_scale)
-
-                # Create styles with calculated font sizes and spacing
-                title_style = ParagraphStyle(
-                    'CustomTitle4x6',
-                    parent=styles['Heading1'],
-                    fontSize=font_sizes['title'],
-                    spaceAfter=spacing['space_after_title'],
-                    alignment=1  # Center
-                )
-
-                heading1_style = ParagraphStyle(
-                    'CustomH1_4x6',
-                    parent=styles['Heading1'],
-                    fontSize=font_sizes['h1'],
-                    spaceAfter=spacing['space_after_h1'],
-                    spaceBefore=spacing['space_before_h1']
-                )
-
-                heading2_style = ParagraphStyle(
-                    'CustomH2_4x6',
-                    parent=styles['Heading2'],
-                    fontSize=font_sizes['h2'],
-                    spaceAfter=spacing['space_after_h2'],
-                    spaceBefore=spacing['space_before_h2']
-                )
-
-                heading3_style = ParagraphStyle(
-                    'CustomH3_4x6',
-                    parent=styles['Heading3'],
-                    fontSize=font_sizes['h3'],
-                    spaceAfter=spacing['space_after_h3'],
-                    spaceBefore=spacing['space_before_h3']
-                )
-
-                body_style = ParagraphStyle(
-                    'CustomBody_4x6',
-                    parent=styles['Normal'],
-                    fontSize=font_sizes['body'],
-                    spaceAfter=spacing['space_after_body'],
-                    leading=font_sizes['leading_body']
-                )
-            else:
-                # Standard document font sizes
-                title_style = ParagraphStyle(
-                    'CustomTitle',
-                    parent=styles['Heading1'],
-                    fontSize=18,
-                    spaceAfter=20,
-                    alignment=1  # Center
-                )
-
-                heading1_style = ParagraphStyle(
-                    'CustomH1',
-                    parent=styles['Heading1'],
-                    fontSize=16,
-                    spaceAfter=16,
-                    spaceBefore=20
-                )
-
-                heading2_style = ParagraphStyle(
-                    'CustomH2',
-                    parent=styles['Heading2'],
-                    fontSize=14,
-                    spaceAfter=12,
-                    spaceBefore=16
-                )
-
-                heading3_style = ParagraphStyle(
-                    'CustomH3',
-                    parent=styles['Heading3'],
-                    fontSize=12,
-                    spaceAfter=10,
-                    spaceBefore=12
-                )
-
-                body_style = ParagraphStyle(
-                    'CustomBody',
-                    parent=styles['Normal'],
-                    fontSize=12,
-                    spaceAfter=8,
-                    leading=14
-                )
-
-            # Build content
-            story = []
-
-            # Add title if filename provided
-            if filename:
-                story.append(Paragraph(filename, title_style))
-                story.append(Spacer(1, 20 if not format4x6 else 15))
-
-            # Process content
-            if MARKDOWN_AVAILABLE:
-                # Use mistune library for processing (simple, no extensions initially)
-                md = mistune.create_markdown(renderer='html')
-                html_content = md(content)
-
-                # Convert HTML to paragraphs with enhanced list processing
-                paragraphs = self._html_to_paragraphs(html_content, body_style, heading1_style, heading2_style, heading3_style)
-
-                # For 4x6 cards, try to keep content together
-                if format4x6 and len(paragraphs) <= 8:
-                    story.append(KeepTogether(paragraphs))
-                else:
-                    story.extend(paragraphs)
-            else:
-                # Fallback: Enhanced markdown processing with list support
-                lines = content.split('\n')
-                in_list = False
-                list_counter = 0
-                ordered_list = False
-
-                for line in lines:
-                    original_line = line
-                    line = line.strip()
-
-                    if not line:
-                        if not in_list:
-                            story.append(Spacer(1, 6))
-                        continue
-
-                    # Check for ordered lists (1. 2. 3. etc.)
-                    ordered_match = re.match(r'^(\d+)\.\s+(.*)', line)
-                    if ordered_match:
-                        if not in_list:
-                            in_list = True
-                            ordered_list = True
-                            list_counter = int(ordered_match.group(1))
-                        elif not ordered_list:
-                            # Starting new ordered list
-                            ordered_list = True
-                            list_counter = int(ordered_match.group(1))
-                        else:
-                            list_counter += 1
-
-                        content = ordered_match.group(2).strip()
-                        # Decode HTML entities only
-                        import html
-                        content = html.unescape(content)
-                        story.append(Paragraph(f"{list_counter}. {content}", body_style))
-                        continue
-
-                    # Check for unordered lists (-, *, +)
-                    unordered_match = re.match(r'^[-\*+]\s+(.*)', line)
-                    if unordered_match:
-                        if not in_list:
-                            in_list = True
-                            ordered_list = False
-                        elif ordered_list:
-                            # Switching to unordered list
-                            ordered_list = False
-
-                        content = unordered_match.group(1).strip()
-                        # Decode HTML entities only
-                        import html
-                        content = html.unescape(content)
-                        story.append(Paragraph(f"• {content}", body_style))
-                        continue
-
-                    # If we were in a list and this isn't a list item, end the list
-                    if in_list:
-                        in_list = False
-                        ordered_list = False
-                        story.append(Spacer(1, 6))
-
-                    # Handle headers
-                    if line.startswith('# '):
-                        heading_text = line[2:].strip()
-                        # Decode HTML entities only
-                        import html
-                        heading_text = html.unescape(heading_text)
-                        story.append(Paragraph(heading_text, heading1_style))
-                    elif line.startswith('## '):
-                        heading_text = line[3:].strip()
-                        import html
-                        heading_text = html.unescape(heading_text)
-                        story.append(Paragraph(heading_text, heading2_style))
-                    elif line.startswith('### '):
-                        heading_text = line[4:].strip()
-                        import html
-                        heading_text = html.unescape(heading_text)
-                        story.append(Paragraph(heading_text, heading3_style))
-                    else:
-                        # Simple formatting for bold and italic
-                        formatted_line = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', line)
-                        formatted_line = re.sub(r'\*(.*?)\*', r'<i>\1</i>', formatted_line)
-                        # Decode HTML entities only
-                        import html
-                        formatted_line = html.unescape(formatted_line)
-                        if formatted_line:
-                            story.append(Paragraph(formatted_line, body_style))
+        if debug:
+            print(f"Created PDF: {path}", file=sys.stderr)
+
+        return path
+
+    def _get_pdf_slot(self) -> str:
+        """Return the temporary file that every print job's PDF is rewritten into."""
+        if self._pdf_slot is None:
+            fd, self._pdf_slot = tempfile.mkstemp(suffix='.pdf')
+            os.close(fd)
+            self.temp_files.append(self._pdf_slot)
+        return self._pdf_slot
+
+    def _render_pdf(self, content: str, filename: Optional[str] = None,
+                    format4x6: bool = False, debug: bool = False, verification_mode: bool = False,
+                    current_font: Optional[float] = None, current_spacing: Optional[float] = None) -> bytes:
+        """Render content to PDF bytes in memory."""
+        try:
+            if format4x6 and not verification_mode:
+                # Fit first: if the fit already rendered the PDF at the chosen
+                # settings, that PDF is the final output
+                self._fitted_pdf = None
+                current_font, current_spacing = self.find_optimal_scaling_with_verification(
+                    content, format4x6, filename, debug)
+                fitted, self._fitted_pdf = self._fitted_pdf, None
+                if fitted and fitted[0] == (content, filename, current_font, current_spacing):
+                    if debug:
+                        print(f"Writing the layout found while fitting: font={current_font:.1f}pt, spacing={current_spacing:.2f}", file=sys.stderr)
+                    pdf_data = fitted[1]()
+                    if not pdf_data:
+                        raise RuntimeError("PDF file was not created or is empty")
+                    return pdf_data
+                verification_mode = True
+
+            buffer = io.BytesIO()
+            doc, story = self._build_document(buffer, content, filename, format4x6, debug,
+                                              verification_mode, current_font, current_spacing)
 
             # Build PDF
             doc.build(story)
 
-            if debug:
-                print(f"Created PDF: {temp_file_path}", file=sys.stderr)
-
             # Verify the PDF was created successfully
-            if not os.path.exists(temp_file_path) or os.path.getsize(temp_file_path) == 0:
+            pdf_data = buffer.getvalue()
+            if not pdf_data:
                 raise RuntimeError("PDF file was not created or is empty")
 
-            return temp_file_path
+            return pdf_data
 
         except Exception as e:
             error_msg = f"Error creating PDF: {e}"
             if debug:
-                import traceback
                 error_msg += f"\nFull traceback: {traceback.format_exc()}"
             # Return the error as a string instead of printing to stderr
             raise Exception(error_msg)
 
-    def _html_to_paragraphs(self, html_content: str, body_style, h1_style, h2_style, h3_style):
-        """Convert HTML content to ReportLab paragraphs with enhanced list support."""
-        paragraphs = []
-        lines = html_content.split('\n')
-
-        in_ul = False
-        in_ol = False
-        list_counter = 0
-
-        def sanitize_text(text):
-            """Sanitize text for ReportLab Paragraph objects."""
-            import html
-            # First decode any existing HTML entities
-            text = html.unescape(text)
-            # Then handle the text for ReportLab - it can handle most characters fine
-            # Just ensure it's clean text, don't double-encode
-            return text.strip()
-
-        for line in lines:
-            line = line.strip()
-            if not line:
-                if not in_ul and not in_ol:
-                    paragraphs.append(Spacer(1, 6))
-                continue
+    def _layout_4x6(self, content: str, filename: Optional[str], font_size: float,
+                    spacing_scale: float, debug: bool = False) -> tuple:
+        """Lay out a 4x6 document at the given settings without writing the PDF yet.
 
-            # Handle list containers
-            if line == '<ul>':
-                in_ul = True
-                continue
-            elif line == '</ul>':
-                in_ul = False
-                paragraphs.append(Spacer(1, 6))
-                continue
-            elif line == '<ol>':
-                in_ol = True
-                list_counter = 0
-                continue
-            elif line == '</ol>':
-                in_ol = False
-                paragraphs.append(Spacer(1, 6))
-                continue
+        Runs the same layout as _render_pdf and returns (page count, finish),
+        where finish() serializes this layout and returns the PDF bytes.
+        Attempts that aren't picked are never serialized or parsed.
+        """
+        try:
+            buffer = io.BytesIO()
+            doc, story = self._build_document(buffer, content, filename, True, debug,
+                                              True, font_size, spacing_scale)
+            doc.build(story, canvasmaker=_deferred_canvas())
+            canv = doc.canv
+
+            def finish() -> bytes:
+                canv.write_pdf()
+                return buffer.getvalue()
 
-            # Handle headers
-            if line.startswith('<h1>'):
-                content = re.sub(r'</?h1>', '', line)
-                content = sanitize_text(content)
-                paragraphs.append(Paragraph(content, h1_style))
-            elif line.startswith('<h2>'):
-                content = re.sub(r'</?h2>', '', line)
-                content = sanitize_text(content)
-                paragraphs.append(Paragraph(content, h2_style))
-            elif line.startswith('<h3>'):
-                content = re.sub(r'</?h3>', '', line)
-                content = sanitize_text(content)
-                paragraphs.append(Paragraph(content, h3_style))
-            elif line.startswith('<li>'):
-                content = re.sub(r'</?li>', '', line)
-                content = sanitize_text(content)
-
-                if in_ul:
-                    # Unordered list item
-                    content = f"• {content}"
-                elif in_ol:
-                    # Ordered list item
-                    list_counter += 1
-                    content = f"{list_counter}. {content}"
+            return canv.getPageNumber() - 1, finish
+
+        except Exception as e:
+            error_msg = f"Error creating PDF: {e}"
+            if debug:
+                error_msg += f"\nFull traceback: {traceback.format_exc()}"
+            raise Exception(error_msg)
+
+    def _build_document(self, buffer, content: str, filename: Optional[str] = None,
+                        format4x6: bool = False, debug: bool = False, verification_mode: bool = False,
+                        current_font: Optional[float] = None, current_spacing: Optional[float] = None) -> tuple:
+        """Set up the page template and flowables for content, returned as (doc, story)."""
+        # Every render path ends up here, so this is where ReportLab gets loaded
+        if not _load_reportlab():
+            raise RuntimeError("ReportLab is required for PDF generation. Install with: pip install reportlab")
+
+        # Set up page size
+        if format4x6:
+            # 4x6 index cards are typically used in landscape orientation
+            # So we make it 6" wide x 4" tall for proper use
+            page_size = (6 * inch, 4 * inch)  # 6x4 inches (landscape 4x6)
+            margin = 0.1 * inch
+        else:
+            page_size = letter
+            margin = 0.75 * inch
+
+        # Create PDF document
+        doc = SimpleDocTemplate(
+            buffer,
+            pagesize=page_size,
+            leftMargin=margin,
+            rightMargin=margin,
+            topMargin=margin,
+            bottomMargin=margin
+        )
+
+        if format4x6:
+            # Multi-dimensional content fitting for 4x6 format
+            if debug:
+                print("Starting multi-dimensional font and spacing optimization...", file=sys.stderr)
+
+            # Find optimal font size and spacing scale with verification
+            # Skip verification if we're already in verification mode (to avoid circular dependency)
+            if verification_mode:
+                # Use the passed current_font and current_spacing values for verification
+                if current_font is not None and current_spacing is not None:
+                    optimal_font_size = current_font
+                    spacing_scale = current_spacing
+                    if debug:
+                        print(f"VERIFICATION MODE: Using passed values font={optimal_font_size:.1f}pt, spacing={spacing_scale:.2f}", file=sys.stderr)
                 else:
-                    # Standalone list item
-                    content = f"• {content}"
-
-                paragraphs.append(Paragraph(content, body_style))
-            elif line.startswith('<p>'):
-                content = re.sub(r'</?p>', '', line)
-                content = sanitize_text(content)
-                paragraphs.append(Paragraph(content, body_style))
-            elif line.startswith('<div') or line.startswith('</div>'):
-                continue  # Skip container tags
+                    # Fallback: Use simple estimation if no values provided
+                    optimal_font_size, spacing_scale = self.find_optimal_scaling(content, format4x6, debug)
+                    if debug:
+                        print(f"VERIFICATION MODE: No values provided, using estimation font={optimal_font_size:.1f}pt, spacing={spacing_scale:.2f}", file=sys.stderr)
             else:
-                # Regular paragraph - sanitize content
-                if not line.startswith('<'):
-                    content = sanitize_text(line)
-                    paragraphs.append(Paragraph(content, body_style))
-                else:
-                    # HTML content - render it properly with ReportLab
-                    # ReportLab can handle basic HTML tags like <b>, <i>, <br>
-                    try:
-                        # Let ReportLab handle the HTML directly
-                        paragraphs.append(Paragraph(line, body_style))
-                    except Exception as e:
-                        # If ReportLab can't handle it, extract clean text
-                        text_content = re.sub(r'<[^>]+>', '', line)
-                        text_content = sanitize_text(text_content)
-                        if text_content.strip():
-                            paragraphs.append(Paragraph(text_content.strip(), body_style))
+                # Use full verification for normal mode
+                optimal_font_size, spacing_scale = self.find_optimal_scaling_with_verification(content, format4x6, filename, debug)
+
+            if debug:
+                print(f"Optimal settings: font={optimal_font_size:.1f}pt, spacing_scale={spacing_scale:.2f}", file=sys.stderr)
+
+            title_style, heading1_style, heading2_style, heading3_style, body_style = \
+                self._get_styles(True, optimal_font_size, spacing_scale)
+        else:
+            title_style, heading1_style, heading2_style, heading3_style, body_style = \
+                self._get_styles(False)
 
-        return paragraphs
+        # Build content
+        story = []
+
+        # Add title if filename provided
+        if filename:
+            story.append(Paragraph(filename, title_style))
+            story.append(Spacer(1, 20 if not format4x6 else 15))
+
+        # Process content
+        if _load_markdown():
+            # Use mistune library for processing (simple, no extensions initially)
+            blocks = _markdown_blocks(content)
+
+            # Convert the parsed blocks to paragraphs in the current styles
+            paragraphs = self._blocks_to_paragraphs(blocks, body_style, heading1_style, heading2_style, heading3_style)
+
+            # For 4x6 cards, try to keep content together
+            if format4x6 and len(paragraphs) <= 8:
+                story.append(KeepTogether(paragraphs))
+            else:
+                story.extend(paragraphs)
+        else:
+            # Fallback: Enhanced markdown processing with list support
+            heading_styles = {'h1': heading1_style, 'h2': heading2_style, 'h3': heading3_style}
+            story.extend(_iter_markdown_paragraphs(content, body_style, heading_styles))
+
+        return doc, story
+
+    def _get_styles(self, format4x6: bool, font_size: Optional[float] = None,
+                    spacing_scale: Optional[float] = None) -> tuple:
+        """Return cached (title, h1, h2, h3, body) paragraph styles for a layout."""
+        key = (format4x6, font_size, spacing_scale) if format4x6 else (False,)
+        bundle = self._style_cache.get(key)
+        if bundle is None:
+            bundle = self._build_styles(format4x6, font_size, spacing_scale)
+            self._style_cache[key] = bundle
+        return bundle
+
+    def _build_styles(self, format4x6: bool, font_size: Optional[float] = None,
+                      spacing_scale: Optional[float] = None) -> tuple:
+        """Build the (title, h1, h2, h3, body) paragraph styles for a layout."""
+        styles = _sample_styles()
+
+        if format4x6:
+            # Calculate font sizes and spacing with optimal settings
+            font_sizes = _calc_font_sizes(font_size, spacing_scale)
+            spacing = _calc_spacing(font_size, spacing_scale)
+
+            # Create styles with calculated font sizes and spacing
+            title_style = ParagraphStyle(
+                'CustomTitle4x6',
+                parent=styles['Heading1'],
+                fontSize=font_sizes['title'],
+                spaceAfter=spacing['space_after_title'],
+                alignment=1  # Center
+            )
+
+            heading1_style = ParagraphStyle(
+                'CustomH1_4x6',
+                parent=styles['Heading1'],
+                fontSize=font_sizes['h1'],
+                spaceAfter=spacing['space_after_h1'],
+                spaceBefore=spacing['space_before_h1']
+            )
+
+            heading2_style = ParagraphStyle(
+                'CustomH2_4x6',
+                parent=styles['Heading2'],
+                fontSize=font_sizes['h2'],
+                spaceAfter=spacing['space_after_h2'],
+                spaceBefore=spacing['space_before_h2']
+            )
+
+            heading3_style = ParagraphStyle(
+                'CustomH3_4x6',
+                parent=styles['Heading3'],
+                fontSize=font_sizes['h3'],
+                spaceAfter=spacing['space_after_h3'],
+                spaceBefore=spacing['space_before_h3']
+            )
+
+            body_style = ParagraphStyle(
+                'CustomBody_4x6',
+                parent=styles['Normal'],
+                fontSize=font_sizes['body'],
+                spaceAfter=spacing['space_after_body'],
+                leading=font_sizes['leading_body']
+            )
+        else:
+            # Standard document font sizes
+            title_style = ParagraphStyle(
+                'CustomTitle',
+                parent=styles['Heading1'],
+                fontSize=18,
+                spaceAfter=20,
+                alignment=1  # Center
+            )
+
+            heading1_style = ParagraphStyle(
+                'CustomH1',
+                parent=styles['Heading1'],
+                fontSize=16,
+                spaceAfter=16,
+                spaceBefore=20
+            )
+
+            heading2_style = ParagraphStyle(
+                'CustomH2',
+                parent=styles['Heading2'],
+                fontSize=14,
+                spaceAfter=12,
+                spaceBefore=16
+            )
+
+            heading3_style = ParagraphStyle(
+                'CustomH3',
+                parent=styles['Heading3'],
+                fontSize=12,
+                spaceAfter=10,
+                spaceBefore=12
+            )
+
+            body_style = ParagraphStyle(
+                'CustomBody',
+                parent=styles['Normal'],
+                fontSize=12,
+                spaceAfter=8,
+                leading=14
+            )
+
+        return title_style, heading1_style, heading2_style, heading3_style, body_style
+
+    def _blocks_to_paragraphs(self, blocks, body_style, h1_style, h2_style, h3_style):
+        """Convert parsed markdown blocks to ReportLab paragraphs and list spacers."""
+        styles = {'body': body_style, 'h1': h1_style, 'h2': h2_style, 'h3': h3_style}
+        return [_make_paragraph(text, styles[key]) if key else Spacer(1, 6) for key, text in blocks]
 
     async def list_printers(self) -> str:
-        """List available printers using PowerShell."""
-        try:
-            result = subprocess.run([
-                'powershell', '-Command',
-                'Get-Printer | Select-Object Name, DriverName, Status | ConvertTo-Json'
-            ], capture_output=True, text=True, timeout=10)
+        """List available printers, reusing a recent result for PRINTER_LIST_TTL seconds."""
+        async with self._printers_lock:
+            timestamp, cached = self._printers_cache
+            if cached is not None and time.monotonic() - timestamp < PRINTER_LIST_TTL:
+                return cached
+
+            result = await self._list_printers_uncached()
+            # Only successful listings are cached so a failure is retried right away
+            if result.startswith("Available Printers:"):
+                self._printers_cache = (time.monotonic(), result)
+            return result
 
-            if result.returncode == 0 and result.stdout.strip():
+    async def _list_printers_uncached(self) -> str:
+        """List available printers using the spooler API, or PowerShell without pywin32."""
+        try:
+            printers_data = None
+            if WIN32PRINT_AVAILABLE:
                 try:
-                    import json
-                    printers_data = json.loads(result.stdout)
-                    if isinstance(printers_data, list) and printers_data:
-                        printer_info = []
-                        for printer in printers_data:
-                            name = printer.get('Name', 'Unknown')
-                            driver = printer.get('DriverName', 'Unknown Driver')
-                            status = printer.get('Status', 'Unknown') or 'Ready'
-                            printer_info.append(f"- {name}\n   Driver: {driver}\n   Status: {status}")
-
-                        return "Available Printers:\n" + "\n\n".join(printer_info)
-                    elif isinstance(printers_data, dict):
-                        name = printers_data.get('Name', 'Unknown')
-                        driver = printers_data.get('DriverName', 'Unknown Driver')
-                        status = printers_data.get('Status', 'Unknown') or 'Ready'
-                        return f"Available Printers:\n- {name}\n   Driver: {driver}\n   Status: {status}"
-                except json.JSONDecodeError:
-                    pass
-
-            # Fallback: Simple printer listing
-            result = subprocess.run([
-                'powershell', '-Command',
-                'Get-WmiObject -Class Win32_Printer | Select-Object -ExpandProperty Name'
-            ], capture_output=True, text=True, timeout=10)
-
-            if result.returncode == 0 and result.stdout.strip():
-                lines = [line.strip() for line in result.stdout.strip().split('\n') if line.strip()]
-                if lines:
-                    return "Available Printers:\n" + "\n".join(f"- {line}" for line in lines)
+                    loop = asyncio.get_running_loop()
+                    printers_data = await loop.run_in_executor(None, _enum_printers)
+                except Exception:
+                    printers_data = None  # Fall back to PowerShell below
+
+            if printers_data is None:
+                # Windows PowerShell 5.1 has no ConvertTo-Json -AsArray, so wrap the
+                # pipeline in @() to always get a JSON array back
+                result = await self._run_command([
+                    'powershell', '-NoProfile', '-NonInteractive', '-Command',
+                    'ConvertTo-Json -Compress -InputObject @(Get-Printer | Select-Object Name, DriverName, Status)'
+                ], timeout=10)
+
+                if result.returncode == 0 and result.stdout.strip():
+                    try:
+                        printers_data = json.loads(result.stdout)
+                    except json.JSONDecodeError:
+                        printers_data = []
+
+            if printers_data:
+                printer_info = []
+                for printer in printers_data:
+                    name = printer.get('Name', 'Unknown')
+                    driver = printer.get('DriverName', 'Unknown Driver')
+                    status = printer.get('Status', 'Unknown') or 'Ready'
+                    printer_info.append(f"- {name}\n   Driver: {driver}\n   Status: {status}")
+
+                if printer_info:
+                    return "Available Printers:\n" + "\n\n".join(printer_info)
 
             return "No printers found or unable to list printers."
 
@@ -1168,13 +1700,18 @@ If this page prints correctly, your setup is working!
 
     def cleanup_temp_files(self):
         """Clean up temporary files."""
-        for temp_file in self.temp_files:
+        temp_files, self.temp_files = self.temp_files, []
+        for temp_file in temp_files:
             try:
-                if os.path.exists(temp_file):
-                    os.unlink(temp_file)
+                os.unlink(temp_file)
+            except FileNotFoundError:
+                pass
             except Exception as e:
                 print(f"Error cleaning up {temp_file}: {e}", file=sys.stderr)
 
+        # Everything tracked is gone, so the slot must be recreated
+        self._pdf_slot = None
+
 async def main():
     """Main entry point."""
     server = PrinterMCPServer()
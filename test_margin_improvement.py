@@ -4,8 +4,13 @@ Test the margin improvement with the exact content that was problematic before
 """
 
 import asyncio
+import re
 from server import PrinterMCPServer
 
+# Font and spacing details reported in a successful 4x6 print result
+_FONT_RE = re.compile(r'font=(\d+\.\d+)pt')
+_SPACING_RE = re.compile(r'spacing=(\d+\.\d+)')
+
 async def test_margin_improvement():
     """Test margin improvement with the original problematic content."""
     print("=== Margin Improvement Test ===\n")
@@ -59,9 +64,8 @@ Fall's effects impact all humanity & creation today. Universal need for Christ's
 
             # Extract font size from result for comparison
             if "font=" in result and "spacing=" in result:
-                import re
-                font_match = re.search(r'font=(\d+\.\d+)pt', result)
-                spacing_match = re.search(r'spacing=(\d+\.\d+)', result)
+                font_match = _FONT_RE.search(result)
+                spacing_match = _SPACING_RE.search(result)
 
                 if font_match and spacing_match:
                     font_size = font_match.group(1)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Test that markdown formatting spanning line breaks renders instead of breaking the PDF
+"""
+
+import asyncio
+import os
+from server import PrinterMCPServer
+
+# Each case is content that used to produce unbalanced markup for ReportLab
+TEST_CASES = [
+    ("Bold across lines", "Some **bold text that\ncontinues here** and more."),
+    ("Italic across lines", "An *italic phrase that\nwraps onto the next line* ends here."),
+    ("Nested emphasis across lines", "Text with **bold and *italic\nspanning* lines** done."),
+    ("Link across lines", "See [the recipe\nsource](https://example.com/?a=1&b=2) for details."),
+    ("Nested lists", "- Ingredients\n  - 2 cups flour\n    - sifted\n  - 1 cup *soft\n    butter*\n- Tools\n\n1. Mix\n2. Bake"),
+    ("Special characters", "Use < 1 cup & > 2 tbsp\nof sugar <b>not bold</b> & stir."),
+]
+
+async def test_markdown_markup():
+    """Render every case as a regular page and as a 4x6 card."""
+    print("=== Markdown Markup Test ===\n")
+
+    server_instance = PrinterMCPServer()
+    failures = 0
+
+    for name, content in TEST_CASES:
+        for format4x6 in (False, True):
+            label = f"{name} ({'4x6' if format4x6 else 'letter'})"
+            try:
+                pdf_file = server_instance.create_formatted_pdf(
+                    content=content,
+                    filename=name,
+                    format4x6=format4x6
+                )
+                if pdf_file and os.path.getsize(pdf_file) > 0:
+                    print(f"[SUCCESS] {label}")
+                else:
+                    print(f"[ERROR] {label}: no PDF created")
+                    failures += 1
+            except Exception as e:
+                print(f"[ERROR] {label}: {e}")
+                failures += 1
+
+    server_instance.cleanup_temp_files()
+
+    if failures:
+        print(f"\n[ERROR] {failures} case(s) failed")
+    else:
+        print("\n[SUCCESS] All markdown cases rendered!")
+
+    print("\n=== Markdown Markup Test Complete ===")
+
+if __name__ == "__main__":
+    asyncio.run(test_markdown_markup())
@@ -122,7 +122,11 @@ Simple 4x6 card printing!
     try:
         printers = await server_instance.list_printers()
         print("OK Printer listing working:")
-        print(printers[:200] + "..." if len(printers) > 200 else printers)
+        if len(printers) > 200:
+            print(printers[:200], end="")
+            print("...")
+        else:
+            print(printers)
     except Exception as e:
         print(f"ERROR Printer listing error: {e}")
 
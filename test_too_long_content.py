@@ -7,6 +7,17 @@ import asyncio
 import os
 from server import PrinterMCPServer
 
+_TOPICS = ["Introduction", "Background", "Methodology", "Results", "Discussion",
+           "Conclusion", "References", "Appendix", "Further Reading", "Summary"]
+
+_LOREM = ("Lorem ipsum dolor sit amet, consectetur adipiscing elit. "
+          "Sed do eiusmod tempor incididunt ut labore et dolore magna aliqua. "
+          "Ut enim ad minim veniam, quis nostrud exercitation ullamco laboris "
+          "nisi ut aliquip ex ea commodo consequat. Duis aute irure dolor in "
+          "reprehenderit in voluptate velit esse cillum dolore eu fugiat nulla "
+          "pariatur. Excepteur sint occaecat cupidatat non proident, sunt in "
+          "culpa qui officia deserunt mollit anim id est laborum.\n\n")
+
 async def test_too_long_content():
     """Test error handling with content that's too long for 2 pages."""
     print("=== Too Long Content Test (Should Return Error) ===\n")
@@ -14,31 +25,24 @@ async def test_too_long_content():
     server_instance = PrinterMCPServer()
 
     # Generate extremely long content that won't fit even at 6pt font
-    long_content = "# Extremely Long Document\n\n"
+    parts = ["# Extremely Long Document\n\n"]
 
     # Add many chapters/sections
     for chapter in range(1, 31):  # 30 chapters!
-        long_content += f"## Chapter {chapter}: Detailed Analysis\n\n"
+        parts.append(f"## Chapter {chapter}: Detailed Analysis\n\n")
 
         # Add detailed content for each chapter
-        topics = ["Introduction", "Background", "Methodology", "Results", "Discussion",
-                 "Conclusion", "References", "Appendix", "Further Reading", "Summary"]
-
-        for topic in topics:
-            long_content += f"### {topic}\n\n"
+        for topic in _TOPICS:
+            parts.append(f"### {topic}\n\n")
 
             # Add multiple paragraphs for each topic
             for para in range(3):
-                long_content += f"This is paragraph {para+1} about {topic} in Chapter {chapter}. "
-                long_content += "Lorem ipsum dolor sit amet, consectetur adipiscing elit. "
-                long_content += "Sed do eiusmod tempor incididunt ut labore et dolore magna aliqua. "
-                long_content += "Ut enim ad minim veniam, quis nostrud exercitation ullamco laboris "
-                long_content += "nisi ut aliquip ex ea commodo consequat. Duis aute irure dolor in "
-                long_content += "reprehenderit in voluptate velit esse cillum dolore eu fugiat nulla "
-                long_content += "pariatur. Excepteur sint occaecat cupidatat non proident, sunt in "
-                long_content += "culpa qui officia deserunt mollit anim id est laborum.\n\n"
-
-        long_content += "---\n\n"
+                parts.append(f"This is paragraph {para+1} about {topic} in Chapter {chapter}. ")
+                parts.append(_LOREM)
+
+        parts.append("---\n\n")
+
+    long_content = "".join(parts)
 
     print(f"Generated content with ~{len(long_content)} characters")
     print("Testing error handling with extremely long content...\n")